@@ -1,86 +1,181 @@
 import re
-import json
+import sys
+
+import orjson
+
+# 流式读取源文件时每次读取的字符数
+_CHUNK_SIZE = 1 << 20
+
+# --- 预编译正则表达式 ---
+# 拼音紧跟在“读音”之后：先用 str.find 定位锚点，再仅在锚点处匹配拼音
+_PINYIN_ANCHOR = "读音"
+_PINYIN_TAIL_RE = re.compile(r"\s*([a-zāáǎàēéěèīíǐìōóǒòūúǔùǖǘǚǜü]+)")
+_DEF_RE = re.compile(r"本义[为是]?\s*([^。，\n]+)")
+# 释义块以行首的《X》起始，直到下一个行首的《为止
+_BLOCK_SPLIT_RE = re.compile(r"\n\s*(?=《)")
+# 块头同时吞掉《X》后的空白，正文只需一次切片
+_ENTRY_HEAD_RE = re.compile(r"\s*《(.)》\s*")
+_TYPE_RE = re.compile(r"(?=(形声|会意|象形|指事))")
+_TYPE_MAP = {"形声": "形声字", "会意": "会意字", "象形": "象形字", "指事": "指事字"}
+# 格式: 0558、奴——怒努弩...
+_MAIN_GROUP_RE = re.compile(r"(\d{4,5})、?\s*([^——\n]+)——\s*([^\d\n]+)")
+# 格式: 刁：叼汈。
+_TWO_CHAR_RE = re.compile(r"([一-龥])：([一-龥]+)。")
+# 格式: 《次》，其形声边为二
+_ONE_CHAR_RE = re.compile(r"《(.)》，其形声边为([^，、\s\(\)]+)")
+
+
+def _find_pinyin(text):
+    """返回第一个“读音”后紧跟的拼音，找不到时返回空字符串。"""
+    idx = text.find(_PINYIN_ANCHOR)
+    while idx != -1:
+        pinyin_match = _PINYIN_TAIL_RE.match(text, idx + len(_PINYIN_ANCHOR))
+        if pinyin_match:
+            # 同音字大量共用同一拼音，驻留后各条目共享同一个字符串对象
+            return sys.intern(pinyin_match.group(1))
+        idx = text.find(_PINYIN_ANCHOR, idx + 1)
+    return ""
 
 
 def parse_char_details(text_block):
     """从单个字的文本描述中提取所有结构化信息。"""
-    details = {}
-    pinyin_match = re.search(r"读音\s*([a-zāáǎàēéěèīíǐìōóǒòūúǔùǖǘǚǜü]+)", text_block)
-    details['pinyin'] = pinyin_match.group(1) if pinyin_match else ""
-    types = set()
-    if "形声" in text_block: types.add("形声字")
-    if "会意" in text_block: types.add("会意字")
-    if "象形" in text_block: types.add("象形字")
-    if "指事" in text_block: types.add("指事字")
-    details['char_type'] = list(types) if types else []
-    definition_match = re.search(r"本义[为是]?\s*([^。，\n]+)", text_block)
-    details['definition'] = definition_match.group(1).strip() if definition_match else ""
-    details['explanation'] = text_block.strip()
-    return details
-
-
-def build_final_database(source_text, additional_text):
+    definition_match = _DEF_RE.search(text_block)
+    # 单次扫描即可找出全部造字法关键词
+    types = {_TYPE_MAP[m] for m in _TYPE_RE.findall(text_block)}
+    # 一次性构建结果字典，减少逐键赋值的开销
+    return {
+        'pinyin': _find_pinyin(text_block),
+        'char_type': list(types),
+        'definition': definition_match.group(1).strip() if definition_match else "",
+        'explanation': text_block.strip(),
+    }
+
+
+def _stream_blocks(f, chunk_size=_CHUNK_SIZE):
     """
-    一个统一的解析器，用于从两个源文件构建最终数据库。
+    按固定大小分块读取文本文件，以行首的《为界逐块产出文本，
+    避免一次性将整个文件读入内存。
     """
-    db = {}
+    tail = ""
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        blocks = _BLOCK_SPLIT_RE.split(tail + chunk)
+        # 最后一块可能尚未读完整，留到下一轮继续拼接
+        tail = blocks.pop()
+        yield from blocks
+    yield tail
+
+
+def _apply_phonetic_groups(db, main_groups, two_char_groups, one_char_groups):
+    """根据收集到的三类匹配结果建立形声字组关系，按格式依次应用。"""
+    # 热循环中使用局部别名，省去每次的属性查找
+    setdefault, get = db.setdefault, db.get
+    # 按形声边驻留 components 字典，共用同一形声边的所有派生字共享一个实例
+    components_cache = {}
 
-    # --- 阶段 1: 建立所有形声字组关系 ---
     # 格式: 0558、奴——怒努弩...
-    main_group_pattern = re.compile(r"(\d{4,5})、?\s*([^——\n]+)——\s*([^\d\n]+)")
-    for _, radical_str, derived_str in main_group_pattern.findall(source_text):
+    for radical_str, derived_str in main_groups:
         radical = radical_str.strip()
-        db.setdefault(radical, {"glyph": radical})['is_phonetic_radical'] = True
-        for char in list(derived_str.strip()):
-            db.setdefault(char, {"glyph": char})
-            db[char]['components'] = {"phonetic_radical": radical}
+        setdefault(radical, {"glyph": radical})['is_phonetic_radical'] = True
+        components = components_cache.setdefault(radical, {"phonetic_radical": radical})
+        for char in derived_str.strip():
+            entry = get(char)
+            if entry is None:
+                entry = db[char] = {"glyph": char, "is_phonetic_radical": False}
+            entry['components'] = components
 
     # 格式: 刁：叼汈。
-    two_char_pattern = re.compile(r"([一-龥])：([一-龥]+)。")
-    for radical, derived_str in two_char_pattern.findall(source_text):
-        db.setdefault(radical, {"glyph": radical})['is_phonetic_radical'] = True
-        for char in list(derived_str):
-            db.setdefault(char, {"glyph": char})
-            db[char]['components'] = {"phonetic_radical": radical}
+    for radical, derived_str in two_char_groups:
+        setdefault(radical, {"glyph": radical})['is_phonetic_radical'] = True
+        components = components_cache.setdefault(radical, {"phonetic_radical": radical})
+        for char in derived_str:
+            entry = get(char)
+            if entry is None:
+                entry = db[char] = {"glyph": char, "is_phonetic_radical": False}
+            entry['components'] = components
 
     # 格式: 《次》，其形声边为二
-    one_char_pattern = re.compile(r"《(.)》，其形声边为([^，、\s\(\)]+)")
-    for derived_char, radical in one_char_pattern.findall(source_text):
-        db.setdefault(radical, {"glyph": radical})['is_phonetic_radical'] = True
-        db.setdefault(derived_char, {"glyph": derived_char})
-        db[derived_char]['components'] = {"phonetic_radical": radical}
+    for derived_char, radical in one_char_groups:
+        setdefault(radical, {"glyph": radical})['is_phonetic_radical'] = True
+        components = components_cache.setdefault(radical, {"phonetic_radical": radical})
+        setdefault(derived_char, {"glyph": derived_char, "is_phonetic_radical": False})['components'] = components
 
-    print(f"阶段1：形声字组关系建立完成。")
 
-    # --- 阶段 2: 从两个文件中解析并填充所有汉字的详细信息 ---
-    all_text = source_text + "\n" + additional_text
-    char_blocks = re.split(r"\n\s*(?=《)", all_text)
+def _split_entry_block(block):
+    """将释义块拆分为 (汉字, 释义正文)；不是释义块时返回 None。"""
+    head_match = _ENTRY_HEAD_RE.match(block)
+    if not head_match:
+        return None
+    # 块尾的换行已被切分正则吃掉，rstrip 通常直接返回原对象
+    return head_match.group(1), block[head_match.end():].rstrip()
 
-    for block in char_blocks:
-        block = block.strip()
-        if not block.startswith("《"): continue
-        char_match = re.match(r"《(.)》", block)
-        if not char_match: continue
 
-        char = char_match.group(1)
-        content = block[len(char) + 2:].strip()
+def _apply_char_details(db, char, content, additional_chars):
+    """将单个释义块的详细信息填充到对应汉字的条目中。"""
+    entry = db.setdefault(char, {"glyph": char, "is_phonetic_radical": False})
+    details = parse_char_details(content)
 
-        entry = db.setdefault(char, {"glyph": char})
-        details = parse_char_details(content)
+    entry['pinyin'] = details['pinyin'] or entry.get('pinyin')
+    entry['definition'] = details['definition'] or entry.get('definition')
 
-        entry['pinyin'] = details['pinyin'] or entry.get('pinyin')
-        entry['definition'] = details['definition'] or entry.get('definition')
+    existing_types = set(entry.get('char_type', []))
+    new_types = set(details['char_type'])
+    entry['char_type'] = list(existing_types.union(new_types))
+
+    if char in additional_chars:
+        entry['analysis'] = {"explanation": details['explanation']}
+    else:
+        entry.setdefault('analysis', {})['explanation'] = details['explanation']
 
-        existing_types = set(entry.get('char_type', []))
-        new_types = set(details['char_type'])
-        entry['char_type'] = list(existing_types.union(new_types))
+    entry.setdefault('phrases', [])
 
-        if char in additional_text:
-            entry['analysis'] = {"explanation": details['explanation']}
-        else:
-            entry.setdefault('analysis', {})['explanation'] = details['explanation']
 
-        entry.setdefault('phrases', [])
+def _is_empty_entry(entry):
+    """定义一个“空”条目的标准：没有拼音，没有定义，也没有任何解释文本。"""
+    return (
+            not entry.get('pinyin') and
+            not entry.get('definition') and
+            not entry.get('analysis', {}).get('explanation')
+    )
+
+
+def build_final_database(source_blocks, additional_blocks):
+    """
+    一个统一的解析器，用于从两个源文件构建最终数据库。
+    两个参数均为文本块的可迭代对象（参见 _stream_blocks），源材料只需遍历一次。
+    """
+    db = {}
+
+    # 附加材料体量较小，且阶段 2 需要预先知道其中出现过的字
+    additional_blocks = list(additional_blocks)
+    # 预先计算附加材料的字符集合，成员判断由全文扫描变为哈希查找
+    additional_chars = frozenset().union(*additional_blocks)
+
+    # --- 阶段 1: 逐块收集形声字组关系，并暂存源材料中的释义块 ---
+    # 同一个字可能被多种格式重复指定形声边，需按格式顺序应用才能保证结果稳定；
+    # 字组须先于释义写入，条目的插入顺序（即搜索结果的顺序）才与分阶段处理时一致
+    main_groups, two_char_groups, one_char_groups = [], [], []
+    source_entries = []
+    for block in source_blocks:
+        main_groups.extend(m.group(2, 3) for m in _MAIN_GROUP_RE.finditer(block))
+        two_char_groups.extend(m.groups() for m in _TWO_CHAR_RE.finditer(block))
+        one_char_groups.extend(m.groups() for m in _ONE_CHAR_RE.finditer(block))
+        parsed = _split_entry_block(block)
+        if parsed:
+            source_entries.append(parsed)
+    _apply_phonetic_groups(db, main_groups, two_char_groups, one_char_groups)
+
+    print(f"阶段1：形声字组关系建立完成。")
+
+    # --- 阶段 2: 依次用源材料和附加材料填充汉字详细信息 ---
+    for char, content in source_entries:
+        _apply_char_details(db, char, content, additional_chars)
+    for block in additional_blocks:
+        parsed = _split_entry_block(block)
+        if parsed:
+            _apply_char_details(db, *parsed, additional_chars)
 
     print(f"阶段2：汉字详细信息填充完成。")
     return db
@@ -89,48 +184,37 @@ def build_final_database(source_text, additional_text):
 # --- 主程序 ---
 if __name__ == "__main__":
     try:
-        with open("source_material.txt", "r", encoding="utf-16") as f:
-            source_text = f.read()
-        with open("additional_material.txt", "r", encoding="utf-16") as f:
-            additional_text = f.read()
+        source_file = open("source_material.txt", "r", encoding="utf-16", buffering=_CHUNK_SIZE)
+        additional_file = open("additional_material.txt", "r", encoding="utf-16", buffering=_CHUNK_SIZE)
     except FileNotFoundError as e:
         print(f"错误：请确保 '{e.filename}' 文件存在于脚本相同目录下。")
         exit()
 
     print("开始构建数据库...")
-    database = build_final_database(source_text, additional_text)
+    with source_file, additional_file:
+        database = build_final_database(_stream_blocks(source_file), _stream_blocks(additional_file))
     print(f"初步构建完成，总条目数: {len(database)}")
 
     # --- 【新增】阶段 3: 清理数据库，移除无释义的空条目 ---
     print("阶段3: 开始清理数据库...")
-    chars_to_delete = []
-    for char, entry in database.items():
-        # 定义一个“空”条目的标准：没有拼音，没有定义，也没有任何解释文本
-        is_empty = (
-                not entry.get('pinyin') and
-                not entry.get('definition') and
-                not entry.get('analysis', {}).get('explanation')
-        )
-        if is_empty:
-            chars_to_delete.append(char)
-
-    if chars_to_delete:
-        print(f"找到 {len(chars_to_delete)} 个空条目需要移除 (例如: {chars_to_delete[:5]}...)")
-        for char in chars_to_delete:
-            del database[char]
+    before_count = len(database)
+    database = {char: entry for char, entry in database.items() if not _is_empty_entry(entry)}
+    removed_count = before_count - len(database)
+
+    if removed_count:
+        print(f"找到并移除了 {removed_count} 个空条目。")
         print("清理完成。")
     else:
         print("数据库无需清理。")
 
     # --- 最终整理和保存 ---
-    for char, entry in database.items():
-        entry.setdefault('is_phonetic_radical', False)
-
+    # 所有条目在创建时已带有 is_phonetic_radical 默认值，无需再遍历补齐
     print(f"最终数据库构建完成，总条目数: {len(database)}")
 
     try:
-        with open("dictionary_database.json", "w", encoding="utf-8") as f:
-            json.dump(database, f, ensure_ascii=False, indent=4)
+        # orjson 直接输出 UTF-8 字节，比标准库 json 的缩进输出快得多
+        with open("dictionary_database.json", "wb") as f:
+            f.write(orjson.dumps(database, option=orjson.OPT_INDENT_2))
         print("\n成功！最终数据库已保存到 'dictionary_database.json'。")
     except Exception as e:
         print(f"写入文件时发生错误: {e}")
\ No newline at end of file
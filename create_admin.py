@@ -2,6 +2,9 @@ import hashlib
 import secrets
 import getpass
 
+# PBKDF2 迭代次数，须与 server.py 中 verify_password 保持一致
+PBKDF2_ITERATIONS = 260000
+
 
 def create_admin_password_hash():
     """
@@ -24,11 +27,12 @@ def create_admin_password_hash():
 
     # 3. 使用 PBKDF2-HMAC-SHA256 算法生成密钥（哈希）
     # 迭代次数设为 260,000，这是一个行业推荐的安全值
+    # hashlib.pbkdf2_hmac 由 OpenSSL 实现，CPU 支持 SHA 扩展指令时会自动启用，无需额外处理
     derived_key = hashlib.pbkdf2_hmac(
         'sha256',
         password.encode('utf-8'),
         salt,
-        260000
+        PBKDF2_ITERATIONS
     )
 
     # 4. 将盐和哈希转换为十六进制字符串，并用 '$' 分隔
@@ -1,39 +1,92 @@
 import re
-import json
+import sys
+
+import orjson
+
+# 流式读取源文件时每次读取的字符数
+_CHUNK_SIZE = 1 << 20
+
+# --- 预编译正则表达式 ---
+# 拼音紧跟在“读音”之后：先用 str.find 定位锚点，再仅在锚点处匹配拼音
+_PINYIN_ANCHOR = "读音"
+_PINYIN_TAIL_RE = re.compile(r"[为是]?\s*([a-zāáǎàēéěèīíǐìōóǒòūúǔùǖǘǚǜü]+)")
+_DEF_RE = re.compile(r"本义[为是]?\s*([^。，\n]+)")
+# 释义块以行首的《X》起始，直到下一个行首的《为止
+_BLOCK_SPLIT_RE = re.compile(r"\n\s*(?=《)")
+# 块头同时吞掉《X》后的空白，正文只需一次切片
+_ENTRY_HEAD_RE = re.compile(r"\s*《(.)》\s*")
+_TYPE_RE = re.compile(r"(?=(形声|会意|象形|指事))")
+_TYPE_MAP = {"形声": "形声字", "会意": "会意字", "象形": "象形字", "指事": "指事字"}
+# 格式: 0558、奴——怒努弩...
+_MAIN_GROUP_RE = re.compile(r"(\d{4,5})、?\s*([^——\n]+)——\s*([^\d\n]+)")
+# 格式: 刁：叼汈。
+_TWO_CHAR_RE = re.compile(r"([一-龥])：([一-龥]+)。")
+# 格式: 《次》，其形声边为二
+_ONE_CHAR_RE = re.compile(r"《(.)》，其形声边为([^，、\s\(\)]+)")
+
+
+def _find_pinyin(text):
+    """返回第一个“读音”后紧跟的拼音，找不到时返回空字符串。"""
+    idx = text.find(_PINYIN_ANCHOR)
+    while idx != -1:
+        pinyin_match = _PINYIN_TAIL_RE.match(text, idx + len(_PINYIN_ANCHOR))
+        if pinyin_match:
+            # 同音字大量共用同一拼音，驻留后各条目共享同一个字符串对象
+            return sys.intern(pinyin_match.group(1))
+        idx = text.find(_PINYIN_ANCHOR, idx + 1)
+    return ""
 
 
 def parse_char_details(text_block):
     """从单个字的文本描述中提取所有结构化信息。"""
-    details = {}
-    pinyin_match = re.search(r"读音[为是]?\s*([a-zāáǎàēéěèīíǐìōóǒòūúǔùǖǘǚǜü]+)", text_block)
-    details['pinyin'] = pinyin_match.group(1) if pinyin_match else ""
-    types = set()
-    if "形声" in text_block: types.add("形声字")
-    if "会意" in text_block: types.add("会意字")
-    if "象形" in text_block: types.add("象形字")
-    if "指事" in text_block: types.add("指事字")
-    details['char_type'] = list(types) if types else ["未知类型"]
-    definition_match = re.search(r"本义[为是]?\s*([^。，\n]+)", text_block)
-    details['definition'] = definition_match.group(1).strip() if definition_match else ""
-    details['explanation'] = text_block.strip()
-    return details
-
-
-def build_database_from_source(source_text):
+    definition_match = _DEF_RE.search(text_block)
+    # 单次扫描即可找出全部造字法关键词
+    types = {_TYPE_MAP[m] for m in _TYPE_RE.findall(text_block)}
+    # 一次性构建结果字典，减少逐键赋值的开销
+    return {
+        'pinyin': _find_pinyin(text_block),
+        'char_type': list(types) if types else ["未知类型"],
+        'definition': definition_match.group(1).strip() if definition_match else "",
+        'explanation': text_block.strip(),
+    }
+
+
+def _stream_blocks(f, chunk_size=_CHUNK_SIZE):
+    """
+    按固定大小分块读取文本文件，以行首的《为界逐块产出文本，
+    避免一次性将整个文件读入内存。
+    """
+    tail = ""
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        blocks = _BLOCK_SPLIT_RE.split(tail + chunk)
+        # 最后一块可能尚未读完整，留到下一轮继续拼接
+        tail = blocks.pop()
+        yield from blocks
+    yield tail
+
+
+def build_database_from_source(source_blocks):
     """
     一个全新的、多阶段的解析器，用于从 source_material.txt 构建数据库。
+    source_blocks 为文本块的可迭代对象（参见 _stream_blocks），只需遍历一次。
     """
     db = {}
 
-    # --- 阶段 1: 解析所有详细释义块 ---
-    char_blocks = re.split(r"\n\s*(?=《)", source_text)
-    for block in char_blocks:
-        block = block.strip()
-        if not block.startswith("《"): continue
-        char_match = re.match(r"《(.)》", block)
-        if not char_match: continue
-        char = char_match.group(1)
-        content = block[len(char) + 2:].strip()
+    # --- 阶段 1: 解析所有详细释义块，同时收集形声字组关系留待阶段 2 ---
+    main_groups, two_char_groups, one_char_groups = [], [], []
+    for block in source_blocks:
+        main_groups.extend(m.group(2, 3) for m in _MAIN_GROUP_RE.finditer(block))
+        two_char_groups.extend(m.groups() for m in _TWO_CHAR_RE.finditer(block))
+        one_char_groups.extend(m.groups() for m in _ONE_CHAR_RE.finditer(block))
+
+        head_match = _ENTRY_HEAD_RE.match(block)
+        if not head_match: continue
+        char = head_match.group(1)
+        # 块尾的换行已被切分正则吃掉，rstrip 通常直接返回原对象
+        content = block[head_match.end():].rstrip()
 
         details = parse_char_details(content)
         db[char] = {
@@ -46,32 +99,37 @@ def build_database_from_source(source_text):
         }
 
     # --- 阶段 2: 解析所有形声字组关系 ---
+    # 热循环中使用局部别名，省去每次的属性查找
+    setdefault, get = db.setdefault, db.get
+    # 按形声边驻留 components 字典，共用同一形声边的所有派生字共享一个实例
+    components_cache = {}
+
     # 格式: 0558、奴——怒努弩...
-    main_group_pattern = re.compile(r"(\d{4,5})、?\s*([^——\n]+)——\s*([^\d\n]+)")
-    matches = main_group_pattern.findall(source_text)
-    for _, radical_str, derived_str in matches:
+    for radical_str, derived_str in main_groups:
         radical = radical_str.strip()
-        db.setdefault(radical, {"glyph": radical})['is_phonetic_radical'] = True
-        for char in list(derived_str.strip()):
-            db.setdefault(char, {"glyph": char})
-            db[char]['components'] = {"phonetic_radical": radical}
+        setdefault(radical, {"glyph": radical})['is_phonetic_radical'] = True
+        components = components_cache.setdefault(radical, {"phonetic_radical": radical})
+        for char in derived_str.strip():
+            entry = get(char)
+            if entry is None:
+                entry = db[char] = {"glyph": char}
+            entry['components'] = components
 
     # 格式: 刁：叼汈。
-    two_char_pattern = re.compile(r"([一-龥])：([一-龥]+)。")
-    matches = two_char_pattern.findall(source_text)
-    for radical, derived_str in matches:
-        db.setdefault(radical, {"glyph": radical})['is_phonetic_radical'] = True
-        for char in list(derived_str):
-            db.setdefault(char, {"glyph": char})
-            db[char]['components'] = {"phonetic_radical": radical}
+    for radical, derived_str in two_char_groups:
+        setdefault(radical, {"glyph": radical})['is_phonetic_radical'] = True
+        components = components_cache.setdefault(radical, {"phonetic_radical": radical})
+        for char in derived_str:
+            entry = get(char)
+            if entry is None:
+                entry = db[char] = {"glyph": char}
+            entry['components'] = components
 
     # 格式: 《次》，其形声边为二
-    one_char_pattern = re.compile(r"《(.)》，其形声边为([^，、\s\(\)]+)")
-    matches = one_char_pattern.findall(source_text)
-    for derived_char, radical in matches:
-        db.setdefault(radical, {"glyph": radical})['is_phonetic_radical'] = True
-        db.setdefault(derived_char, {"glyph": derived_char})
-        db[derived_char]['components'] = {"phonetic_radical": radical}
+    for derived_char, radical in one_char_groups:
+        setdefault(radical, {"glyph": radical})['is_phonetic_radical'] = True
+        components = components_cache.setdefault(radical, {"phonetic_radical": radical})
+        setdefault(derived_char, {"glyph": derived_char})['components'] = components
 
     return db
 
@@ -79,19 +137,20 @@ def build_database_from_source(source_text):
 # --- 主程序 ---
 if __name__ == "__main__":
     try:
-        with open("source_material.txt", "r", encoding="utf-16") as f:
-            source_text = f.read()
+        source_file = open("source_material.txt", "r", encoding="utf-16", buffering=_CHUNK_SIZE)
     except FileNotFoundError:
         print("错误：请确保 'source_material.txt' 文件存在。")
         exit()
 
     print("开始从源材料构建基础数据库...")
-    database = build_database_from_source(source_text)
+    with source_file:
+        database = build_database_from_source(_stream_blocks(source_file))
     print(f"基础数据库构建完成，包含 {len(database)} 个条目。")
 
     try:
-        with open("dictionary_database.json", "w", encoding="utf-8") as f:
-            json.dump(database, f, ensure_ascii=False, indent=4)
+        # orjson 直接输出 UTF-8 字节，比标准库 json 的缩进输出快得多
+        with open("dictionary_database.json", "wb") as f:
+            f.write(orjson.dumps(database, option=orjson.OPT_INDENT_2))
         print("成功！基础数据库已保存到 'dictionary_database.json'。")
         print("下一步，请运行 'update_database.py' 来补充权威数据。")
     except Exception as e:
@@ -1,24 +1,35 @@
 # --- START OF FILE main.py (Final Corrected Version) ---
 
 import asyncio
+import functools
 import json
 import os
+import sys
 import uuid
 from datetime import datetime
 
 import bleach
 import flet as ft
 import requests
+from requests.adapters import HTTPAdapter
 
 # --- 常量与辅助函数 ---
 SERVER_URL = "替换为你的服务器"
 CLIENT_CONFIG_FILE = "client_config.json"
+# Python 3.11+ 的 datetime.fromisoformat 可直接解析结尾的 'Z'
+FROMISOFORMAT_ACCEPTS_Z = sys.version_info >= (3, 11)
 
+# 全局复用的 HTTP 会话，保持长连接，避免每次请求都重新握手
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
 
+
+@functools.lru_cache(maxsize=1)
 def get_persistent_machine_id():
     """
     获取一个持久化的、基于UUID的设备ID。
-    首次运行时生成并保存，后续从本地文件读取。
+    首次运行时生成并保存，后续从本地文件读取；同一进程内只读取一次。
     """
     if os.path.exists(CLIENT_CONFIG_FILE):
         try:
@@ -32,14 +43,24 @@ def get_persistent_machine_id():
 
     new_machine_id = str(uuid.uuid4())
     try:
-        with open(CLIENT_CONFIG_FILE, 'w') as f:
+        # 先写临时文件再原子替换，避免写入中断留下损坏的配置
+        tmp_file = f"{CLIENT_CONFIG_FILE}.tmp"
+        with open(tmp_file, 'w') as f:
             json.dump({"machine_id": new_machine_id}, f)
+        os.replace(tmp_file, CLIENT_CONFIG_FILE)
     except IOError:
         print(f"警告：无法将设备ID写入到 {CLIENT_CONFIG_FILE}。本次运行将使用临时ID。")
 
     return new_machine_id
 
 
+def parse_server_datetime(value):
+    """解析服务器返回的 ISO 8601 时间字符串，仅在旧版 Python 上才替换结尾的 'Z'。"""
+    if not FROMISOFORMAT_ACCEPTS_Z:
+        value = value.replace('Z', '+00:00')
+    return datetime.fromisoformat(value)
+
+
 class AppState:
     """集中管理应用状态"""
 
@@ -50,50 +71,48 @@ class AppState:
         self.card_type = None
 
 
+@functools.lru_cache(maxsize=1024)
+def sanitize_text(text):
+    """
+    清理来自服务器的文本以安全显示。
+    bleach.clean 开销较大，同一字条常在多次查询中重复出现，因此缓存结果。
+    """
+    return bleach.clean(text)
+
+
 # --- 【新增】结果显示辅助函数 ---
 def create_result_display(data):
     """
     根据单条查询结果数据，构建一个信息完整的显示卡片。
     这个函数的功能复刻自 old_main.py 中的 create_result_card。
     """
-    parts = []
-
-    # 1. 标题：字形和拼音
     glyph = data.get("glyph", "")
-    pinyin = data.get("pinyin", "")
-    if glyph:
-        parts.append(f"### {glyph} ({pinyin})")
-
-    # 2. 类型
     char_type = data.get("char_type")
-    if char_type and isinstance(char_type, list):
-        parts.append(f'**类型:** `{" / ".join(char_type)}`')
-
-    # 3. 分析（结构和解析）
     analysis = data.get("analysis", {})
-    if isinstance(analysis, dict):
-        structure = analysis.get("structure")
-        if structure:
-            parts.append(f'**结构:** {structure}')
-        explanation = analysis.get("explanation")
-        if explanation:
-            # 清理HTML以安全显示
-            safe_explanation = bleach.clean(explanation)
-            parts.append(f'**解析:** {safe_explanation}')
-
-    # 4. 本意/定义
+    if not isinstance(analysis, dict):
+        analysis = {}
+    structure = analysis.get("structure")
+    explanation = analysis.get("explanation")
     definition = data.get("definition")
-    if definition:
-        safe_definition = bleach.clean(definition)
-        parts.append(f'**本意:** {safe_definition}')
-
-    # 5. 组词
     phrases = data.get("phrases")
-    if phrases and isinstance(phrases, list):
-        parts.append(f'**组词:** `{"、".join(phrases)}`')
+
+    # 按显示顺序列出各部分，条件不满足的部分为 None，合并时跳过
+    parts = (
+        # 1. 标题：字形和拼音
+        f"### {glyph} ({data.get('pinyin', '')})" if glyph else None,
+        # 2. 类型
+        f'**类型:** `{" / ".join(char_type)}`' if char_type and isinstance(char_type, list) else None,
+        # 3. 分析（结构和解析），解析内容清理HTML以安全显示
+        f'**结构:** {structure}' if structure else None,
+        f'**解析:** {sanitize_text(explanation)}' if explanation else None,
+        # 4. 本意/定义
+        f'**本意:** {sanitize_text(definition)}' if definition else None,
+        # 5. 组词
+        f'**组词:** `{"、".join(phrases)}`' if phrases and isinstance(phrases, list) else None,
+    )
 
     # 将所有部分用换行符合并成最终的Markdown文本
-    final_text = "\n\n".join(parts)
+    final_text = "\n\n".join(part for part in parts if part)
 
     # 返回一个带边框和内边距的容器，使其成为一个卡片
     return ft.Container(
@@ -120,7 +139,7 @@ async def main(page: ft.Page):
     async def perform_request(url, payload, timeout=15):
         try:
             response = await asyncio.to_thread(
-                requests.post, url, json=payload, timeout=timeout, data=None)
+                _SESSION.post, url, json=payload, timeout=timeout, data=None)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.HTTPError as e:
@@ -166,7 +185,7 @@ async def main(page: ft.Page):
         else:
             if result.get("status") == "activated":
                 state.is_activated = True
-                expires_dt = datetime.fromisoformat(result.get("expires_at").replace('Z', '+00:00'))
+                expires_dt = parse_server_datetime(result["expires_at"])
                 state.expires_at = expires_dt.strftime('%Y-%m-%d %H:%M:%S')
                 state.card_type = result.get("card_type")
                 if show_success:
@@ -1,23 +1,28 @@
+import codecs
 import json
 import os
-import uuid
 import secrets
 import hashlib
 import hmac
 import threading
 import time
-from collections import Counter, deque
+import itertools
+import sys
+from collections import Counter, defaultdict, deque
+from contextlib import closing
 from datetime import datetime, timedelta, timezone
 import logging
 from functools import wraps
 import sqlite3 # 导入SQLite3库
 
-from flask import Flask, request, jsonify, render_template, redirect, url_for, flash, session
+from flask import Flask, request, render_template, redirect, url_for, flash, session
 # 导入 Flask-WTF 相关模块
 from flask_wtf import FlaskForm
 from flask_wtf.csrf import CSRFProtect
 from wtforms import StringField, IntegerField, SelectField, PasswordField
 from wtforms.validators import DataRequired, NumberRange
+import ijson
+import orjson
 
 # FileLock 不再需要，SQLite自带更高效的锁机制
 import psutil
@@ -62,6 +67,8 @@ app.config['SECRET_KEY'] = config.get('FLASK_SECRET_KEY')
 ADMIN_PASSWORD_HASH = config.get('ADMIN_PASSWORD_HASH')
 CARD_DURATIONS = {k: timedelta(days=v) for k, v in config.get("CARD_DURATIONS", {}).items()}
 GENERATE_CODE_LIMIT = config.get("GENERATE_CODE_LIMIT", 5000)
+# 数据库中UTC时间的存储格式，直接以 Z 结尾
+ISO_UTC_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
 
 if not ADMIN_PASSWORD_HASH:
     logging.warning("管理员密码未设置！管理功能将无法使用。请运行 create_admin.py 生成。")
@@ -74,11 +81,68 @@ class GenerateCodesForm(FlaskForm):
     quantity = IntegerField('生成数量', default=10, validators=[DataRequired(), NumberRange(min=1, max=GENERATE_CODE_LIMIT, message=f"数量必须在1到{GENERATE_CODE_LIMIT}之间")])
     card_type = SelectField('卡类型', choices=list(CARD_DURATIONS.keys()))
 
+_static_forms = {}
+def static_form(form_class):
+    """
+    GET 请求只需渲染空表单：按表单类缓存一个不绑定请求数据、不含CSRF字段的实例复用，
+    CSRF令牌由模板通过 csrf_token() 单独输出。
+    """
+    form = _static_forms.get(form_class)
+    if form is None:
+        form = _static_forms[form_class] = form_class(formdata=None, meta={'csrf': False})
+    return form
+
+def json_response(payload, status=200):
+    """使用 orjson 序列化的 JSON 响应，替代 jsonify"""
+    return app.response_class(orjson.dumps(payload), status=status, mimetype='application/json')
+
 # --- 3. 【全新】SQLite数据库辅助函数 ---
+# 每个 Waitress 工作线程持有一个长连接，避免每个请求都重新打开数据库文件
+_db_local = threading.local()
+
+# 热点查询语句统一定义为常量，配合长连接的语句缓存跳过重复的解析/规划
+# 过期判断直接在SQL中用整数时间戳完成，命中行的值为 1 (有效) 或 0 (已过期)
+SQL_DEVICE_VALID = "SELECT expires_at_ts > ? FROM devices WHERE machine_id = ?"
+SQL_DEVICE_STATUS = "SELECT card_type, expires_at, expires_at_ts > ? AS active FROM devices WHERE machine_id = ?"
+SQL_CODE_INFO = "SELECT type, used_by FROM codes WHERE code = ?"
+SQL_DEVICE_EXISTS = "SELECT 1 FROM devices WHERE machine_id = ?"
+# 批量插入激活码：整批以JSON数组传入，一条语句完成插入，RETURNING 返回实际插入（未撞码）的激活码
+SQL_INSERT_CODES = "INSERT OR IGNORE INTO codes (code, type, used_by) SELECT value, ?, NULL FROM json_each(?) RETURNING code"
+# RETURNING 需要 SQLite 3.35 及以上版本，更低版本退回 executemany 并按 rowcount 统计实际插入数
+INSERT_RETURNING_SUPPORTED = sqlite3.sqlite_version_info >= (3, 35, 0)
+SQL_INSERT_CODE = "INSERT OR IGNORE INTO codes (code, type, used_by) VALUES (?, ?, NULL)"
+# 需要建立 trigram 全文索引的表及其搜索列
+FTS_TABLES = {"codes": ("code", "used_by"), "devices": ("machine_id",)}
+
+def trigram_fts_supported():
+    """检测当前 SQLite 是否支持 FTS5 的 trigram 分词器（需要 3.34 及以上版本且编译了 FTS5）"""
+    if sqlite3.sqlite_version_info < (3, 34, 0):
+        return False
+    try:
+        with closing(sqlite3.connect(":memory:")) as conn:
+            conn.execute("CREATE VIRTUAL TABLE probe USING fts5(x, tokenize='trigram')")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+# 不支持时不建全文索引，子串搜索全部退回 LIKE 扫描
+TRIGRAM_FTS_SUPPORTED = trigram_fts_supported()
+
 def get_db_connection():
-    """创建并返回一个数据库连接，并设置行工厂为 sqlite3.Row"""
-    conn = sqlite3.connect(DATABASE_FILE, timeout=10) # 增加超时以应对高并发
-    conn.row_factory = sqlite3.Row # 这样可以像访问字典一样访问列
+    """
+    返回当前线程复用的数据库连接（首次调用时创建），行工厂为 sqlite3.Row。
+    连接处于自动提交模式，写操作需显式使用 BEGIN 开启事务。
+    """
+    conn = getattr(_db_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(DATABASE_FILE, timeout=10, isolation_level=None, cached_statements=256) # 增加超时以应对高并发
+        conn.row_factory = sqlite3.Row # 这样可以像访问字典一样访问列
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-65536")
+        conn.execute("PRAGMA mmap_size=268435456")
+        _db_local.conn = conn
     return conn
 
 def create_schema(conn):
@@ -97,8 +161,10 @@ def create_schema(conn):
             card_type TEXT NOT NULL,
             activated_at TEXT NOT NULL,
             expires_at TEXT NOT NULL,
+            expires_at_ts INTEGER,
             FOREIGN KEY (activation_code) REFERENCES codes (code)
         );
+        CREATE INDEX IF NOT EXISTS idx_devices_activated_at ON devices(activated_at);
 
         CREATE TABLE IF NOT EXISTS dictionary (
             glyph TEXT PRIMARY KEY,
@@ -107,6 +173,64 @@ def create_schema(conn):
     """)
     conn.commit()
 
+def upgrade_schema(conn):
+    """为旧数据库补充整数形式的过期时间戳列 expires_at_ts 并回填，同时补齐后续新增的索引和全文检索表"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(devices)")}
+    if 'expires_at_ts' not in columns:
+        conn.execute("ALTER TABLE devices ADD COLUMN expires_at_ts INTEGER")
+    conn.execute("UPDATE devices SET expires_at_ts = CAST(strftime('%s', expires_at) AS INTEGER) WHERE expires_at_ts IS NULL")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_devices_expiry ON devices(machine_id, expires_at_ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_devices_activated_at ON devices(activated_at)")
+    conn.commit()
+    if not TRIGRAM_FTS_SUPPORTED:
+        logging.warning(f"当前 SQLite {sqlite3.sqlite_version} 不支持 FTS5 trigram 分词器，管理面板搜索将使用 LIKE 扫描。")
+        return
+    # 管理面板的子串搜索使用 trigram 全文索引，由触发器与原表保持同步。
+    # 注意：codes/devices 的主键是 TEXT，索引关联的是隐式 rowid，而 VACUUM 可能重新编号隐式 rowid，
+    # 之后索引会指向错误的行。因此每次启动都 'rebuild' 一次；运行期间执行过 VACUUM 须重启服务。
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for table, columns in FTS_TABLES.items():
+        fts = f"{table}_fts"
+        if fts in existing:
+            conn.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+            continue
+        cols = ", ".join(columns)
+        new_cols = ", ".join(f"new.{c}" for c in columns)
+        old_cols = ", ".join(f"old.{c}" for c in columns)
+        conn.executescript(f"""
+            CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{table}', content_rowid='rowid', tokenize='trigram');
+            CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts}(rowid, {cols}) VALUES (new.rowid, {new_cols});
+            END;
+            CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.rowid, {old_cols});
+            END;
+            CREATE TRIGGER {fts}_au AFTER UPDATE ON {table} BEGIN
+                INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.rowid, {old_cols});
+                INSERT INTO {fts}(rowid, {cols}) VALUES (new.rowid, {new_cols});
+            END;
+            INSERT INTO {fts}({fts}) VALUES ('rebuild');
+        """)
+    conn.commit()
+
+def fts_condition(table, search, columns):
+    """
+    构建子串搜索条件。3个字符及以上走 trigram 全文索引，
+    更短的关键词无法组成 trigram，或 SQLite 不支持 trigram 时，退回 LIKE 扫描。返回 (条件, 参数列表)
+    """
+    if TRIGRAM_FTS_SUPPORTED and len(search) >= 3:
+        phrase = '"' + search.replace('"', '""') + '"'
+        return f"rowid IN (SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH ?)", [phrase]
+    pattern = f"%{search}%"
+    return "(" + " OR ".join(f"{c} LIKE ?" for c in columns) + ")", [pattern] * len(columns)
+
+def open_json_stream(path):
+    """以二进制方式打开JSON文件供 ijson 流式解析，并跳过可能存在的 UTF-8 BOM"""
+    f = open(path, 'rb')
+    if f.read(len(codecs.BOM_UTF8)) != codecs.BOM_UTF8:
+        f.seek(0)
+    return f
+
 def convert_json_to_sqlite():
     """
     【一次性迁移函数】
@@ -118,53 +242,58 @@ def convert_json_to_sqlite():
     logging.info("未找到SQLite数据库，开始从JSON文件进行一次性数据迁移...")
     
     try:
-        with get_db_connection() as conn:
+        # 迁移使用独立的一次性连接，失败时可以安全删除数据库文件
+        with closing(sqlite3.connect(DATABASE_FILE)) as conn:
+            # page_size / auto_vacuum 只能在建表之前对新库生效
+            conn.execute("PRAGMA page_size=4096")
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA mmap_size=268435456")
+            # 迁移失败会直接删除数据库文件，因此导入期间无需落盘保证
+            conn.execute("PRAGMA journal_mode=MEMORY")
+            conn.execute("PRAGMA synchronous=OFF")
             create_schema(conn)
             
+            # 所有导入放在同一个事务中完成
+            conn.execute("BEGIN")
+            # 旧JSON文件均以 ijson 流式解析，逐条交给 executemany，避免整个文件常驻内存
             # 迁移激活码
-            if os.path.exists(OLD_CODES_DB_FILE):
-                with open(OLD_CODES_DB_FILE, 'r', encoding='utf-8-sig') as f:
-                    codes_data = json.load(f) if os.path.getsize(OLD_CODES_DB_FILE) > 0 else []
-                if codes_data:
-                    # 确保每个code对象都有type字段
-                    for code in codes_data:
-                        if 'type' not in code:
-                            code['type'] = 'monthly' # 为旧数据提供默认值
-                    conn.executemany(
+            if os.path.exists(OLD_CODES_DB_FILE) and os.path.getsize(OLD_CODES_DB_FILE) > 0:
+                with open_json_stream(OLD_CODES_DB_FILE) as f:
+                    # 确保每个code对象都有type字段，为旧数据提供默认值
+                    codes_data = ({"type": "monthly", **code} for code in ijson.items(f, 'item'))
+                    cursor = conn.executemany(
                         "INSERT OR IGNORE INTO codes (code, type, used_by) VALUES (:code, :type, :used_by)",
                         codes_data
                     )
-                logging.info(f"成功迁移 {len(codes_data)} 条激活码数据。")
+                logging.info(f"成功迁移 {cursor.rowcount} 条激活码数据。")
 
             # 迁移设备
-            if os.path.exists(OLD_DEVICES_DB_FILE):
-                with open(OLD_DEVICES_DB_FILE, 'r', encoding='utf-8-sig') as f:
-                    devices_data = json.load(f) if os.path.getsize(OLD_DEVICES_DB_FILE) > 0 else {}
-                if devices_data:
-                    device_list = [
-                        {**v, "machine_id": k} for k, v in devices_data.items()
-                    ]
-                    conn.executemany(
+            if os.path.exists(OLD_DEVICES_DB_FILE) and os.path.getsize(OLD_DEVICES_DB_FILE) > 0:
+                with open_json_stream(OLD_DEVICES_DB_FILE) as f:
+                    device_list = ({**v, "machine_id": k} for k, v in ijson.kvitems(f, ''))
+                    cursor = conn.executemany(
                         "INSERT OR IGNORE INTO devices (machine_id, activation_code, card_type, activated_at, expires_at) VALUES (:machine_id, :activation_code, :card_type, :activated_at, :expires_at)",
                         device_list
                     )
-                logging.info(f"成功迁移 {len(devices_data)} 条设备数据。")
+                logging.info(f"成功迁移 {cursor.rowcount} 条设备数据。")
 
             # 迁移字典
-            if os.path.exists(OLD_DICTIONARY_FILE):
-                with open(OLD_DICTIONARY_FILE, 'r', encoding='utf-8-sig') as f:
-                    dict_data = json.load(f) if os.path.getsize(OLD_DICTIONARY_FILE) > 0 else {}
-                if dict_data:
-                    dict_list = [
-                        {"glyph": k, "data": json.dumps(v, ensure_ascii=False)} for k, v in dict_data.items()
-                    ]
-                    conn.executemany(
+            if os.path.exists(OLD_DICTIONARY_FILE) and os.path.getsize(OLD_DICTIONARY_FILE) > 0:
+                with open_json_stream(OLD_DICTIONARY_FILE) as f:
+                    # use_float 让小数解析为 float 而不是 Decimal，以便 orjson 序列化
+                    dict_list = (
+                        {"glyph": k, "data": orjson.dumps(v).decode('utf-8')} for k, v in ijson.kvitems(f, '', use_float=True)
+                    )
+                    cursor = conn.executemany(
                         "INSERT OR IGNORE INTO dictionary (glyph, data) VALUES (:glyph, :data)",
                         dict_list
                     )
-                logging.info(f"成功迁移 {len(dict_data)} 条字典数据。")
+                logging.info(f"成功迁移 {cursor.rowcount} 条字典数据。")
             
             conn.commit()
+            # 导入完成后切换为服务运行时使用的 WAL 模式（该设置会持久化到数据库文件）
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
             logging.info("✅ 数据迁移成功！建议您现在可以备份并删除旧的.json文件。")
 
     except Exception as e:
@@ -179,43 +308,116 @@ def require_activated_device(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         machine_id = str(request.json.get('machine_id'))
-        if not machine_id: return jsonify({"error": "无效请求"}), 400
+        if not machine_id: return json_response({"error": "无效请求"}, 400)
         
-        with get_db_connection() as conn:
-            device_info = conn.execute("SELECT expires_at FROM devices WHERE machine_id = ?", (machine_id,)).fetchone()
+        conn = get_db_connection()
+        device_info = conn.execute(SQL_DEVICE_VALID, (int(time.time()), machine_id)).fetchone()
 
-        if not device_info: return jsonify({"error": "未经授权"}), 403
+        if not device_info: return json_response({"error": "未经授权"}, 403)
         
-        expires_at = datetime.fromisoformat(device_info['expires_at'].replace('Z', '+00:00'))
-        if expires_at <= datetime.now(timezone.utc):
+        if not device_info[0]:
             logging.warning(f"已过期的设备尝试访问: {machine_id}")
-            return jsonify({"error": "订阅已过期"}), 403
+            return json_response({"error": "订阅已过期"}, 403)
         
         return f(*args, **kwargs)
     
     return decorated_function
 
 # --- 字典索引构建 (已更新为从SQLite加载) ---
-dictionary_data, pinyin_index, char_type_index = {}, {}, {}
+dictionary_data, pinyin_index, char_type_index, phonetic_radical_index = {}, {}, {}, {}
 def build_indexes():
-    global dictionary_data, pinyin_index, char_type_index
+    global dictionary_data, pinyin_index, char_type_index, phonetic_radical_index
     logging.info("正在从SQLite构建字典索引...")
-    with get_db_connection() as conn:
-        rows = conn.execute("SELECT glyph, data FROM dictionary").fetchall()
-    for row in rows:
-        entry = json.loads(row['data'])
-        dictionary_data[row['glyph']] = entry
+    rows = get_db_connection().execute("SELECT glyph, data FROM dictionary").fetchall()
+    position = {}
+    for i, row in enumerate(rows):
+        glyph = sys.intern(row['glyph'])
+        entry = orjson.loads(row['data'])
+        dictionary_data[glyph] = entry
+        position[id(entry)] = i
         pinyin = (entry.get("pinyin") or "").lower()
         if pinyin: pinyin_index.setdefault(pinyin, []).append(entry)
-        for char_type in entry.get("char_type", []):
+        # 每个条目在各索引列表中只出现一次，查询时无需再去重
+        for char_type in dict.fromkeys(entry.get("char_type", [])):
             char_type_index.setdefault(char_type, []).append(entry)
+        radical = entry.get("components", {}).get("phonetic_radical")
+        if radical: phonetic_radical_index.setdefault(radical, []).append(entry)
+    # 声旁字本身也属于它的形声字组，按字典原有顺序插入
+    for radical, group in phonetic_radical_index.items():
+        entry = dictionary_data.get(radical)
+        if entry is not None and entry.get("components", {}).get("phonetic_radical") != radical:
+            group.append(entry)
+            group.sort(key=lambda e: position[id(e)])
+    # 启动后索引只读：键统一驻留，列表固化为更紧凑的元组
+    pinyin_index = {sys.intern(k): tuple(v) for k, v in pinyin_index.items()}
+    char_type_index = {sys.intern(k): tuple(v) for k, v in char_type_index.items()}
+    phonetic_radical_index = {sys.intern(k): tuple(v) for k, v in phonetic_radical_index.items()}
     logging.info(f"索引构建完成，共加载 {len(dictionary_data)} 条目。")
 
 # --- 监控相关代码 ---
 stats_lock = threading.Lock()
+# 请求计数不再加锁：itertools.count 的自增在 C 层完成，Counter 的单键自增在统计场景下足够准确
+_req_counter = itertools.count(1)
+next_req = _req_counter.__next__
 total_requests, endpoint_counts = 0, Counter()
 cpu_history, net_history = deque(maxlen=30), deque(maxlen=30)
 last_net_io, last_net_time = psutil.net_io_counters(), time.time()
+# 系统指标由后台线程按固定间隔采集，请求处理中只读取最新快照
+MONITORING_SAMPLE_INTERVAL = 1.0
+system_snapshot = {}
+# 接口占比饼图排名很少变化，由后台线程定期重算，轮询时直接复用
+PIE_REFRESH_INTERVAL = 5.0
+endpoint_pie_chart = {"labels": [], "data": []}
+# 监控数据在1秒内复用同一份已序列化的快照，多个面板同时轮询时只序列化一次
+MONITORING_CACHE_TTL = 1.0
+_mon_cache = {'t': 0.0, 'payload': None}
+
+def sample_system_stats():
+    """采集一次 CPU/内存/网络数据，追加到历史记录并更新 system_snapshot"""
+    global last_net_io, last_net_time, system_snapshot
+    cpu_percent = psutil.cpu_percent(interval=None)
+    memory = psutil.virtual_memory()
+    current_net_io = psutil.net_io_counters()
+    current_time = time.time()
+    time_diff = current_time - last_net_time
+    bytes_sent_per_sec = (current_net_io.bytes_sent - last_net_io.bytes_sent) / time_diff if time_diff > 0 else 0
+    bytes_recv_per_sec = (current_net_io.bytes_recv - last_net_io.bytes_recv) / time_diff if time_diff > 0 else 0
+    last_net_io, last_net_time = current_net_io, current_time
+    with stats_lock:
+        cpu_history.append(cpu_percent)
+        net_history.append({"sent_kbps": bytes_sent_per_sec / 1024, "recv_kbps": bytes_recv_per_sec / 1024})
+        system_snapshot = {
+            "cpu_percent": cpu_percent, "cpu_history": list(cpu_history),
+            "mem_percent": memory.percent, "mem_used_mb": round(memory.used / 1e6, 2),
+            "mem_total_mb": round(memory.total / 1e6, 2), "net_history": list(net_history)
+        }
+
+def refresh_endpoint_pie():
+    """按当前请求计数重新计算接口占比饼图（前5名 + other）"""
+    global endpoint_pie_chart
+    total = total_requests
+    # 计数在无锁情况下持续更新，先复制一份再排序
+    top_5 = endpoint_counts.copy().most_common(5)
+    pie_labels = [item[0] for item in top_5]
+    pie_data = [item[1] for item in top_5]
+    other_count = total - sum(pie_data)
+    if other_count > 0:
+        pie_labels.append('other')
+        pie_data.append(other_count)
+    endpoint_pie_chart = {"labels": pie_labels, "data": pie_data}
+
+def system_sampler():
+    """后台守护线程：每隔 MONITORING_SAMPLE_INTERVAL 秒采样一次，每隔 PIE_REFRESH_INTERVAL 秒重算饼图"""
+    last_pie_time = time.time()
+    while True:
+        time.sleep(MONITORING_SAMPLE_INTERVAL)
+        try:
+            sample_system_stats()
+            if time.time() - last_pie_time >= PIE_REFRESH_INTERVAL:
+                refresh_endpoint_pie()
+                last_pie_time = time.time()
+        except Exception as e:
+            logging.error(f"系统指标采样失败: {e}")
 
 @app.after_request
 def record_request_stats(response):
@@ -223,45 +425,26 @@ def record_request_stats(response):
     if request.endpoint in excluded_endpoints:
         return response
     global total_requests
-    with stats_lock:
-        total_requests += 1
-        endpoint_counts[request.endpoint or 'notfound'] += 1
+    total_requests = next_req()
+    endpoint_counts[request.endpoint or 'notfound'] += 1
     return response
 
 @app.route('/api/monitoring_data')
 def monitoring_data():
-    if not session.get('logged_in'): return jsonify({"error": "Unauthorized"}), 401
-    global last_net_io, last_net_time
+    if not session.get('logged_in'): return json_response({"error": "Unauthorized"}, 401)
     with stats_lock:
-        cpu_percent = psutil.cpu_percent(interval=None)
-        cpu_history.append(cpu_percent)
-        memory = psutil.virtual_memory()
-        current_net_io = psutil.net_io_counters()
-        current_time = time.time()
-        time_diff = current_time - last_net_time
-        bytes_sent_per_sec = (current_net_io.bytes_sent - last_net_io.bytes_sent) / time_diff if time_diff > 0 else 0
-        bytes_recv_per_sec = (current_net_io.bytes_recv - last_net_io.bytes_recv) / time_diff if time_diff > 0 else 0
-        last_net_io, last_net_time = current_net_io, time.time()
-        net_history.append({"sent_kbps": bytes_sent_per_sec / 1024, "recv_kbps": bytes_recv_per_sec / 1024})
-        top_5 = endpoint_counts.most_common(5)
-        pie_labels = [item[0] for item in top_5]
-        pie_data = [item[1] for item in top_5]
-        other_count = total_requests - sum(pie_data)
-        if other_count > 0:
-            pie_labels.append('other')
-            pie_data.append(other_count)
+        if time.time() - _mon_cache['t'] < MONITORING_CACHE_TTL:
+            return app.response_class(_mon_cache['payload'], mimetype='application/json')
         response_data = {
-            "system": {
-                "cpu_percent": cpu_percent, "cpu_history": list(cpu_history),
-                "mem_percent": memory.percent, "mem_used_mb": round(memory.used / 1e6, 2),
-                "mem_total_mb": round(memory.total / 1e6, 2), "net_history": list(net_history)
-            },
+            "system": system_snapshot,
             "app": {
                 "total_requests": total_requests,
-                "endpoint_pie_chart": {"labels": pie_labels, "data": pie_data}
+                "endpoint_pie_chart": endpoint_pie_chart
             }
         }
-    return jsonify(response_data)
+        payload = _mon_cache['payload'] = orjson.dumps(response_data)
+        _mon_cache['t'] = time.time()
+    return app.response_class(payload, mimetype='application/json')
 
 @app.route('/monitoring')
 def monitoring():
@@ -278,9 +461,43 @@ def verify_password(stored_hash, provided_password):
     except (ValueError, IndexError):
         return False
 
+# 登录失败限流：同一IP在滑动窗口内失败次数达到上限后，直接拒绝而不再计算PBKDF2
+LOGIN_MAX_ATTEMPTS, LOGIN_WINDOW_SECONDS = 5, 60
+_login_attempts = defaultdict(lambda: deque(maxlen=LOGIN_MAX_ATTEMPTS))
+_login_lock = threading.Lock()
+_login_prune = {'at': time.monotonic()}  # 上次整表清理过期IP的时间
+
+def login_rate_limited(ip):
+    """清理窗口外的失败记录，并返回该IP当前是否需要被限流"""
+    now = time.monotonic()
+    with _login_lock:
+        attempts = _login_attempts[ip]
+        while attempts and now - attempts[0] > LOGIN_WINDOW_SECONDS:
+            attempts.popleft()
+        if not attempts:
+            del _login_attempts[ip]
+            return False
+        return len(attempts) >= LOGIN_MAX_ATTEMPTS
+
+def record_login_failure(ip):
+    """记录一次失败；每个窗口周期顺带清理一次整表，移除最近一次失败已在窗口外的IP，防止不再登录的IP永久残留"""
+    now = time.monotonic()
+    with _login_lock:
+        if now - _login_prune['at'] > LOGIN_WINDOW_SECONDS:
+            _login_prune['at'] = now
+            for stale_ip in [k for k, v in _login_attempts.items() if not v or now - v[-1] > LOGIN_WINDOW_SECONDS]:
+                del _login_attempts[stale_ip]
+        _login_attempts[ip].append(now)
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
+    if request.method == 'GET':
+        return render_template('login.html', form=static_form(LoginForm))
     form = LoginForm()
+    if login_rate_limited(request.remote_addr):
+        logging.warning(f"登录尝试过于频繁，已拒绝: {request.remote_addr}")
+        flash('登录尝试过于频繁，请稍后再试。', 'error')
+        return render_template('login.html', form=form), 429
     if form.validate_on_submit():
         if verify_password(ADMIN_PASSWORD_HASH, form.password.data):
             session['logged_in'] = True
@@ -288,6 +505,7 @@ def login():
             logging.info("管理员登录成功。")
             return redirect(url_for('manage'))
         else:
+            record_login_failure(request.remote_addr)
             flash('密码错误。', 'error')
             logging.warning("失败的管理员登录尝试。")
     return render_template('login.html', form=form)
@@ -301,43 +519,45 @@ def logout():
 @app.route('/check_status', methods=['POST'])
 def check_status():
     machine_id = str(request.json.get('machine_id'))
-    if not machine_id: return jsonify({"error": "无效请求"}), 400
+    if not machine_id: return json_response({"error": "无效请求"}, 400)
     
-    with get_db_connection() as conn:
-        device_info = conn.execute("SELECT card_type, expires_at FROM devices WHERE machine_id = ?", (machine_id,)).fetchone()
+    conn = get_db_connection()
+    device_info = conn.execute(SQL_DEVICE_STATUS, (int(time.time()), machine_id)).fetchone()
 
-    if not device_info: return jsonify({"status": "unactivated"})
+    if not device_info: return json_response({"status": "unactivated"})
     
-    expires_at = datetime.fromisoformat(device_info['expires_at'].replace('Z', '+00:00'))
-    if expires_at > datetime.now(timezone.utc):
-        return jsonify({"status": "activated", "expires_at": device_info['expires_at'], "card_type": device_info['card_type']})
+    if device_info['active']:
+        return json_response({"status": "activated", "expires_at": device_info['expires_at'], "card_type": device_info['card_type']})
     else:
-        return jsonify({"status": "expired", "expires_at": device_info['expires_at']})
+        return json_response({"status": "expired", "expires_at": device_info['expires_at']})
 
 @app.route('/activate', methods=['POST'])
 def activate():
     data = request.json
     machine_id, code_str = str(data.get('machine_id')), data.get('code')
-    if not all([machine_id, code_str]): return jsonify({"error": "无效请求"}), 400
+    if not all([machine_id, code_str]): return json_response({"error": "无效请求"}, 400)
 
     try:
-        with get_db_connection() as conn:
+        conn = get_db_connection()
+        with conn:
+            # 立即获取写锁，保证“检查激活码 -> 标记已用”整体原子，避免并发重复激活
+            conn.execute("BEGIN IMMEDIATE")
             # 检查激活码
-            code_info = conn.execute("SELECT type, used_by FROM codes WHERE code = ?", (code_str,)).fetchone()
+            code_info = conn.execute(SQL_CODE_INFO, (code_str,)).fetchone()
             if not code_info or code_info['used_by']:
                 logging.warning(f"失败的激活尝试，激活码: {code_str}, 设备ID: {machine_id}")
-                return jsonify({"error": "无效的激活码"}), 403
+                return json_response({"error": "无效的激活码"}, 403)
             # 检查设备
-            device_info = conn.execute("SELECT 1 FROM devices WHERE machine_id = ?", (machine_id,)).fetchone()
+            device_info = conn.execute(SQL_DEVICE_EXISTS, (machine_id,)).fetchone()
             if device_info:
                 logging.warning(f"重复激活尝试，设备ID: {machine_id}")
-                return jsonify({"error": "操作失败"}), 409
+                return json_response({"error": "操作失败"}, 409)
 
             card_type = code_info['type']
             duration = CARD_DURATIONS.get(card_type)
             if not duration:
                 logging.error(f"发现无效的卡类型 '{card_type}' 在激活码 {code_str} 中。")
-                return jsonify({"error": "无效的卡类型"}), 500
+                return json_response({"error": "无效的卡类型"}, 500)
 
             now = datetime.now(timezone.utc)
             expires_at = now + duration
@@ -346,28 +566,27 @@ def activate():
             cursor = conn.cursor()
             cursor.execute("UPDATE codes SET used_by = ? WHERE code = ?", (machine_id, code_str))
             cursor.execute(
-                "INSERT INTO devices (machine_id, activation_code, card_type, activated_at, expires_at) VALUES (?, ?, ?, ?, ?)",
-                (machine_id, code_str, card_type, now.isoformat().replace('+00:00', 'Z'), expires_at.isoformat().replace('+00:00', 'Z'))
+                "INSERT INTO devices (machine_id, activation_code, card_type, activated_at, expires_at, expires_at_ts) VALUES (?, ?, ?, ?, ?, ?)",
+                (machine_id, code_str, card_type, now.strftime(ISO_UTC_FORMAT), expires_at.strftime(ISO_UTC_FORMAT), int(expires_at.timestamp()))
             )
-            conn.commit()
 
     except sqlite3.Error as e:
         logging.error(f"激活操作数据库错误: {e}")
-        return jsonify({"error": "服务器内部错误"}), 500
+        return json_response({"error": "服务器内部错误"}, 500)
 
     logging.info(f"设备 {machine_id} 使用激活码 {code_str} 成功激活。")
-    return jsonify({"message": "激活成功！", "expires_at": expires_at.isoformat()})
+    return json_response({"message": "激活成功！", "expires_at": expires_at})
 
 @app.route('/get_identities', methods=['POST'])
 @require_activated_device
 def get_identities():
     char = request.json.get('char')
     entry = dictionary_data.get(char)
-    if not entry: return jsonify({"error": f"字典中未找到 '{char}'"}), 404
+    if not entry: return json_response({"error": f"字典中未找到 '{char}'"}, 404)
     identities = [{"type": "definition", "query": char, "label": f"查看“{char}”的定义"}]
     if entry.get("is_phonetic_radical") or entry.get("components", {}).get("phonetic_radical"):
         identities.append({"type": "phonetic_group", "query": char, "label": f"查看“{char}”所属的形声字组"})
-    return jsonify(identities)
+    return json_response(identities)
 
 @app.route('/advanced_search', methods=['POST'])
 @require_activated_device
@@ -377,34 +596,45 @@ def advanced_search():
     if search_type == 'definition':
         if query in dictionary_data: results.append(dictionary_data[query])
     elif search_type == 'pinyin':
-        results = pinyin_index.get(query.lower(), [])
+        results = pinyin_index.get(query.lower(), ())
     elif search_type == 'char_type':
-        results = char_type_index.get(query, [])
+        results = char_type_index.get(query, ())
     elif search_type == 'phonetic_group':
         entry = dictionary_data.get(query)
         radical = entry.get("components", {}).get("phonetic_radical") if entry else None
         if entry and entry.get("is_phonetic_radical"): radical = query
         if radical:
-            results = [e for e in dictionary_data.values() if e.get("components", {}).get("phonetic_radical") == radical or e.get('glyph') == radical]
+            results = phonetic_radical_index.get(radical) or ((dictionary_data[radical],) if radical in dictionary_data else ())
         elif entry:
             results = [entry]
-    unique_results = list({item['glyph']: item for item in results}.values())
-    return jsonify(unique_results)
+    return json_response(results)
 
 # --- 6. 管理面板路由 (已全面更新为SQLite) ---
 @app.route('/manage', methods=['GET', 'POST'])
 def manage():
     if not session.get('logged_in'): return redirect(url_for('login'))
+    if request.method == 'GET':
+        return render_template('manage.html', form=static_form(GenerateCodesForm))
     form = GenerateCodesForm()
     if form.validate_on_submit():
         quantity = form.quantity.data
         card_type = form.card_type.data
-        new_codes = [{"code": str(uuid.uuid4()).split('-')[0].upper(), "type": card_type, "used_by": None} for _ in range(quantity)]
         
         try:
-            with get_db_connection() as conn:
-                conn.executemany("INSERT INTO codes (code, type, used_by) VALUES (:code, :type, :used_by)", new_codes)
-                conn.commit()
+            conn = get_db_connection()
+            with conn:
+                conn.execute("BEGIN")
+                # 一次性取出所需的随机字节再切分为8位激活码；撞上已有激活码时被忽略，补足差额即可
+                remaining = quantity
+                while remaining:
+                    raw = secrets.token_hex(4 * remaining).upper()
+                    new_codes = [raw[i:i + 8] for i in range(0, 8 * remaining, 8)]
+                    if INSERT_RETURNING_SUPPORTED:
+                        inserted = conn.execute(SQL_INSERT_CODES, (card_type, orjson.dumps(new_codes).decode('utf-8'))).fetchall()
+                        remaining -= len(inserted)
+                    else:
+                        cursor = conn.executemany(SQL_INSERT_CODE, [(code, card_type) for code in new_codes])
+                        remaining -= cursor.rowcount
             flash(f"成功生成 {quantity} 个新的 {card_type} 激活码！", "success")
             logging.info(f"管理员生成了 {quantity} 个类型为 {card_type} 的新激活码。")
         except sqlite3.Error as e:
@@ -414,9 +644,29 @@ def manage():
         return redirect(url_for('manage'))
     return render_template('manage.html', form=form)
 
+def fetch_page(conn, query_base, params, order_by, page, per_page):
+    """用 COUNT(*) OVER () 在取分页数据的同一次查询中得到总数，返回 (items, total)"""
+    rows = conn.execute(
+        f"SELECT *, COUNT(*) OVER () AS _total {query_base} ORDER BY {order_by} LIMIT ? OFFSET ?",
+        [*params, per_page, (page - 1) * per_page]
+    ).fetchall()
+    if rows:
+        total = rows[0]['_total']
+    elif page > 1 or per_page <= 0:
+        # 页码超出范围或每页条数为0时窗口函数没有行可返回，单独统计总数
+        total = conn.execute(f"SELECT COUNT(*) {query_base}", params).fetchone()[0]
+    else:
+        total = 0
+    items = []
+    for row in rows:
+        item = dict(row)
+        del item['_total']
+        items.append(item)
+    return items, total
+
 @app.route('/api/management_data')
 def management_data():
-    if not session.get('logged_in'): return jsonify({"error": "未经授权"}), 401
+    if not session.get('logged_in'): return json_response({"error": "未经授权"}, 401)
     
     code_page = request.args.get('code_page', 1, type=int)
     code_per_page = request.args.get('code_per_page', 10, type=int)
@@ -427,53 +677,50 @@ def management_data():
     device_per_page = request.args.get('device_per_page', 10, type=int)
     device_search = request.args.get('device_search', '', type=str)
     
-    with get_db_connection() as conn:
-        # 构建激活码查询
-        code_query_base = "FROM codes"
-        code_params = []
-        conditions = []
-        if code_search:
-            conditions.append("(code LIKE ? OR used_by LIKE ?)")
-            code_params.extend([f"%{code_search}%", f"%{code_search}%"])
-        if show_unused:
-            conditions.append("used_by IS NULL")
-        if conditions:
-            code_query_base += " WHERE " + " AND ".join(conditions)
+    conn = get_db_connection()
+    # 构建激活码查询
+    code_query_base = "FROM codes"
+    code_params = []
+    conditions = []
+    if code_search:
+        condition, params = fts_condition("codes", code_search, FTS_TABLES["codes"])
+        conditions.append(condition)
+        code_params.extend(params)
+    if show_unused:
+        conditions.append("used_by IS NULL")
+    if conditions:
+        code_query_base += " WHERE " + " AND ".join(conditions)
+    
+    codes_items, total_codes = fetch_page(conn, code_query_base, code_params, "code DESC", code_page, code_per_page)
+
+    # 构建设备查询
+    device_query_base = "FROM devices"
+    device_params = []
+    if device_search:
+        condition, device_params = fts_condition("devices", device_search, FTS_TABLES["devices"])
+        device_query_base += " WHERE " + condition
         
-        total_codes = conn.execute(f"SELECT COUNT(*) {code_query_base}", code_params).fetchone()[0]
-        codes_query = f"SELECT * {code_query_base} ORDER BY code DESC LIMIT ? OFFSET ?"
-        code_params.extend([code_per_page, (code_page - 1) * code_per_page])
-        codes_items = [dict(row) for row in conn.execute(codes_query, code_params).fetchall()]
-
-        # 构建设备查询
-        device_query_base = "FROM devices"
-        device_params = []
-        if device_search:
-            device_query_base += " WHERE machine_id LIKE ?"
-            device_params.append(f"%{device_search}%")
-            
-        total_devices = conn.execute(f"SELECT COUNT(*) {device_query_base}", device_params).fetchone()[0]
-        devices_query = f"SELECT * {device_query_base} ORDER BY activated_at DESC LIMIT ? OFFSET ?"
-        device_params.extend([device_per_page, (device_page - 1) * device_per_page])
-        devices_items = [dict(row) for row in conn.execute(devices_query, device_params).fetchall()]
+    devices_items, total_devices = fetch_page(conn, device_query_base, device_params, "activated_at DESC", device_page, device_per_page)
 
-    return jsonify({
+    return json_response({
         "codes": {"items": codes_items, "total": total_codes, "page": code_page, "per_page": code_per_page},
         "devices": {"items": devices_items, "total": total_devices, "page": device_page, "per_page": device_per_page}
     })
 
 @app.route('/api/revoke_authorization', methods=['POST'])
 def revoke_authorization():
-    if not session.get('logged_in'): return jsonify({"error": "未经授权"}), 401
+    if not session.get('logged_in'): return json_response({"error": "未经授权"}, 401)
     machine_id = request.json.get('machine_id')
-    if not machine_id: return jsonify({"error": "无效请求"}), 400
+    if not machine_id: return json_response({"error": "无效请求"}, 400)
     
     try:
-        with get_db_connection() as conn:
+        conn = get_db_connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
             # 先找到对应的激活码
             device_info = conn.execute("SELECT activation_code FROM devices WHERE machine_id = ?", (machine_id,)).fetchone()
             if not device_info:
-                return jsonify({"error": "设备未找到"}), 404
+                return json_response({"error": "设备未找到"}, 404)
             
             code_to_reset = device_info['activation_code']
             
@@ -482,14 +729,13 @@ def revoke_authorization():
             cursor.execute("DELETE FROM devices WHERE machine_id = ?", (machine_id,))
             if code_to_reset:
                 cursor.execute("UPDATE codes SET used_by = NULL WHERE code = ?", (code_to_reset,))
-            conn.commit()
 
     except sqlite3.Error as e:
         logging.error(f"撤销授权数据库错误: {e}")
-        return jsonify({"error": "服务器内部错误"}), 500
+        return json_response({"error": "服务器内部错误"}, 500)
 
     logging.info(f"设备 {machine_id} 的授权已被撤销。")
-    return jsonify({"message": "授权已成功撤销。"})
+    return json_response({"message": "授权已成功撤销。"})
 
 # --- CSRF 豁免 ---
 csrf.exempt(check_status)
@@ -501,8 +747,12 @@ csrf.exempt(advanced_search)
 if __name__ == '__main__':
     # 【关键】在应用启动前执行一次性数据迁移
     convert_json_to_sqlite()
+    with closing(sqlite3.connect(DATABASE_FILE)) as conn:
+        upgrade_schema(conn)
     
     build_indexes()
+    sample_system_stats()
+    threading.Thread(target=system_sampler, daemon=True).start()
     threads = (os.cpu_count() or 1) * 2
     logging.info(f"✅ 启动生产级服务器 Waitress (http://0.0.0.0:5000)，使用 {threads} 个线程。")
     serve(app, host='0.0.0.0', port=5000, threads=threads)
@@ -1,13 +1,19 @@
 import requests
+from requests.adapters import HTTPAdapter
 import threading
 import time
 import argparse
-import uuid
+import os
 import random
 import json
+import math
+import itertools
+import re
+import traceback
 import numpy as np
+import orjson
 from collections import Counter
-from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
 
 
 # --- 1. 配置 ---
@@ -32,45 +38,75 @@ SHARED_STATE = {
     'session': requests.Session(),
     'activation_codes': [],
     'activated_machines': [],
+    'activated_snapshot': (),  # activated_machines 的只读快照，每个场景结束后发布一次，负载生成器无需加锁即可读取
     'csrf_token': None # 新增：用于存储会话期间的CSRF令牌
 }
 state_lock = threading.Lock()
 test_results = {}
 
+# 响应时间以对数分桶的直方图记录：桶号 = ln(1 + 微秒数) * 缩放系数，
+# 相邻桶约相差 1%，2048 个桶可覆盖到远超请求超时的时长
+LATENCY_HIST_BINS = 2048
+LATENCY_HIST_SCALE = 100
+_thread_stats = threading.local()
+# 请求体由 orjson 预先序列化后以 data= 发送，需自行声明内容类型
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+
+def mount_connection_pool(session, pool_size):
+    """按并发数设置连接池大小，避免并发超过默认的10个连接时反复丢弃并重建连接"""
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
 
 
 # --- 3. 动态负载生成器 ---
-def gen_check_status_payload():
-    with state_lock:
-        # 50% 的几率检查一个已激活的设备，50% 检查一个不存在的设备
-        if SHARED_STATE['activated_machines'] and random.random() > 0.5:
-            return {"machine_id": random.choice(SHARED_STATE['activated_machines'])}
-    return {"machine_id": str(uuid.uuid4())}
+SAMPLE_CHARS = np.array(['龙', '山', '水', '天', '地', '人', '爱', '光', '电'])
+SEARCH_TYPES = np.array(['definition', 'pinyin', 'char_type', 'phonetic_group'])
+
+
+def prepare_random_batch(num_requests):
+    """场景开始前一次性生成所有请求要用到的随机数，各请求按自己的序号取用"""
+    rng = np.random.default_rng()
+    # 服务端不校验设备ID格式，一次取出所有随机字节，每16字节对应一个32位十六进制ID
+    hex_ids = os.urandom(16 * num_requests).hex()
+    return {
+        'coin': rng.random(num_requests).tolist(),
+        'pick': rng.random(num_requests).tolist(),  # [0, 1) 之间，按取用时的列表长度换算为下标
+        'char': rng.choice(SAMPLE_CHARS, size=num_requests).tolist(),
+        'search_type': rng.choice(SEARCH_TYPES, size=num_requests).tolist(),
+        'machine_id': [hex_ids[k:k + 32] for k in range(0, len(hex_ids), 32)],
+    }
 
 
-def gen_activate_payload():
+def gen_check_status_payload(batch, i):
+    # 50% 的几率检查一个已激活的设备，50% 检查一个不存在的设备
+    activated = SHARED_STATE['activated_snapshot']
+    if activated and batch['coin'][i] > 0.5:
+        return {"machine_id": activated[int(batch['pick'][i] * len(activated))]}
+    return {"machine_id": batch['machine_id'][i]}
+
+
+def gen_activate_payload(batch, i):
     with state_lock:
         if not SHARED_STATE['activation_codes']: return None
         code = SHARED_STATE['activation_codes'].pop(0)
-        machine_id = str(uuid.uuid4())
-        return {"code": code, "machine_id": machine_id}
+        return {"code": code, "machine_id": batch['machine_id'][i]}
 
 
-def gen_search_or_identity_payload():
-    with state_lock:
-        if not SHARED_STATE['activated_machines']: return None
-        machine_id = random.choice(SHARED_STATE['activated_machines'])
-    sample_chars = ['龙', '山', '水', '天', '地', '人', '爱', '光', '电']
-    char = random.choice(sample_chars)
-    return {"machine_id": machine_id, "char": char}
+def gen_search_or_identity_payload(batch, i):
+    activated = SHARED_STATE['activated_snapshot']
+    if not activated: return None
+    machine_id = activated[int(batch['pick'][i] * len(activated))]
+    return {"machine_id": machine_id, "char": batch['char'][i]}
 
 
-def gen_advanced_search_payload():
-    base_payload = gen_search_or_identity_payload()
+def gen_advanced_search_payload(batch, i):
+    base_payload = gen_search_or_identity_payload(batch, i)
     if not base_payload: return None
-    search_types = ['definition', 'pinyin', 'char_type', 'phonetic_group']
     search_queries = {'definition': base_payload['char'], 'pinyin': 'long', 'char_type': '常用字'}
-    search_type = random.choice(search_types)
+    search_type = batch['search_type'][i]
     query = search_queries.get(search_type, base_payload['char'])
     return {"machine_id": base_payload['machine_id'], "search_type": search_type, "query": query}
 
@@ -88,17 +124,46 @@ SCENARIO_EXECUTION_ORDER = ['check_status', 'activate', 'get_identities', 'advan
 
 
 # --- 5. 核心工作函数 ---
-def make_request(base_url, scenario_name):
+def latency_bin(seconds):
+    """响应时间（秒）所属的直方图桶号，负值归入第0桶"""
+    return min(LATENCY_HIST_BINS - 1, int(math.log1p(max(seconds, 0.0) * 1e6) * LATENCY_HIST_SCALE))
+
+
+def histogram_quantiles(hist, quantiles):
+    """根据直方图累计计数估算各分位数（秒），取所在桶的中点"""
+    cumulative = np.cumsum(hist)
+    bins = np.searchsorted(cumulative, np.asarray(quantiles) * cumulative[-1])
+    return np.expm1((bins + 0.5) / LATENCY_HIST_SCALE) / 1e6
+
+
+def thread_scenario_stats(scenario_name):
+    """返回当前线程在该场景下的统计缓冲区，首次使用时创建并登记到场景结果中"""
+    buffers = getattr(_thread_stats, 'buffers', None)
+    if buffers is None:
+        buffers = _thread_stats.buffers = {}
+    stats = buffers.get(scenario_name)
+    if stats is None:
+        stats = buffers[scenario_name] = {
+            'status_codes': Counter(), 'errors': Counter(),
+            'hist': np.zeros(LATENCY_HIST_BINS, dtype=np.uint32), 'sum': 0.0, 'max': 0.0
+        }
+        with state_lock:
+            test_results[scenario_name]['thread_buffers'].append(stats)
+    return stats
+
+
+def make_request(scenario_name, batch, i):
     """发送单个请求并记录详细结果"""
     scenario = SCENARIOS[scenario_name]
-    payload = scenario['payload_generator']()
+    payload = scenario['payload_generator'](batch, i)
     if payload is None: return
+    body = orjson.dumps(payload)  # 在计时开始前完成序列化，响应时间只反映请求本身
 
-    url = f"{base_url.rstrip('/')}{scenario['endpoint']}"
     status_code, error_message = None, None
-    start_time = time.time()
+    start_time = time.perf_counter()  # 单调时钟，不受系统时间调整影响
     try:
-        response = SHARED_STATE['session'].request(scenario['method'], url, json=payload, timeout=10)
+        response = SHARED_STATE['session'].request(scenario['method'], scenario['_url'], data=body,
+                                                   headers=JSON_HEADERS, timeout=10)
         status_code = response.status_code
         if status_code != 200:
             error_message = response.text
@@ -108,37 +173,71 @@ def make_request(base_url, scenario_name):
     except requests.exceptions.RequestException as e:
         status_code = -1  # 代表客户端网络异常
         error_message = str(e)
-    end_time = time.time()
+    end_time = time.perf_counter()
 
-    with state_lock:
-        test_results[scenario_name]['status_codes'][status_code] += 1
-        test_results[scenario_name]['response_times'].append(end_time - start_time)
-        if error_message:
-            test_results[scenario_name]['errors'][error_message] += 1
+    # 结果写入本线程自己的缓冲区，无需加锁，场景结束后再合并
+    elapsed = end_time - start_time
+    stats = thread_scenario_stats(scenario_name)
+    stats['status_codes'][status_code] += 1
+    if error_message:
+        stats['errors'][error_message] += 1
+    stats['hist'][latency_bin(elapsed)] += 1
+    stats['sum'] += elapsed
+    if elapsed > stats['max']:
+        stats['max'] = elapsed
 
 
-def run_scenario(base_url, scenario_name, num_requests, concurrency):
+def run_scenario(executor, base_url, scenario_name, num_requests, concurrency):
     print(f"\n{'=' * 20} 场景: {scenario_name.upper()} {'=' * 20}")
     print(f"  - 端点: {SCENARIOS[scenario_name]['endpoint']}")
     print(f"  - 请求数: {num_requests}, 并发数: {concurrency}")
 
+    # 完整URL在场景内不变，只拼接一次
+    SCENARIOS[scenario_name]['_url'] = f"{base_url.rstrip('/')}{SCENARIOS[scenario_name]['endpoint']}"
+    batch = prepare_random_batch(num_requests)
     test_results[scenario_name] = {
         'start_time': time.time(), 'status_codes': Counter(),
-        'response_times': [], 'errors': Counter()
+        'thread_buffers': [], 'errors': Counter()
     }
-    threads = []
-    for _ in range(num_requests):
-        thread = threading.Thread(target=make_request, args=(base_url, scenario_name))
-        threads.append(thread)
-        thread.start()
-        if len(threads) >= concurrency:
-            for t in threads: t.join()
-            threads = []
-    for t in threads: t.join()
-    test_results[scenario_name]['end_time'] = time.time()
+    # 在共享线程池中启动 concurrency 个工作者，各自从同一个计数器领取请求序号直到领完，
+    # 每个工作者一结束上一个请求就立刻发下一个，不必为每个请求单独提交任务
+    next_index = itertools.count()
+
+    def worker():
+        for i in next_index:
+            if i >= num_requests: return
+            make_request(scenario_name, batch, i)
+
+    futures = [executor.submit(worker) for _ in range(concurrency)]
+    # 逐个取结果：工作者异常退出会降低实际并发，打印异常而不是静默丢弃
+    for future in futures:
+        try:
+            future.result()
+        except Exception:
+            print(f"[ERROR] 场景 {scenario_name} 的工作线程异常退出:")
+            traceback.print_exc()
+    results = test_results[scenario_name]
+    results['end_time'] = time.time()
+    # 场景依次执行，激活场景运行期间没有读者，结束后一次性发布快照即可
+    SHARED_STATE['activated_snapshot'] = tuple(SHARED_STATE['activated_machines'])
+    for buffer in results['thread_buffers']:
+        results['status_codes'].update(buffer['status_codes'])
+        results['errors'].update(buffer['errors'])
 
 
 # --- 6. 前置与清理任务 (已修正) ---
+_CSRF_RE = re.compile(r'name=["\']csrf_token["\'][^>]*value=["\']([^"\']+)', re.IGNORECASE)
+
+
+def extract_csrf_token(html):
+    """从页面中提取 CSRF 令牌：优先用正则直接匹配，匹配不到时才完整解析 HTML"""
+    match = _CSRF_RE.search(html)
+    if match:
+        return match.group(1)
+    from lxml import html as lxml_html
+    return lxml_html.fromstring(html).xpath('string(//input[@name="csrf_token"]/@value)') or None
+
+
 def prerequisite_tasks(base_url, num_codes_to_generate):
     print(f"[INFO] 执行前置任务: 登录并生成 {num_codes_to_generate} 个激活码...")
 
@@ -147,8 +246,7 @@ def prerequisite_tasks(base_url, num_codes_to_generate):
         # 步骤 1: GET登录页面以获取CSRF令牌
         login_page_res = session.get(f"{base_url}/login", timeout=10)
         login_page_res.raise_for_status()
-        soup = BeautifulSoup(login_page_res.text, 'lxml')
-        csrf_token = soup.find('input', {'name': 'csrf_token'}).get('value')
+        csrf_token = extract_csrf_token(login_page_res.text)
         if not csrf_token:
             raise Exception("无法在登录页面上找到CSRF令牌")
 
@@ -169,8 +267,7 @@ def prerequisite_tasks(base_url, num_codes_to_generate):
         # --- 关键修正：在生成激活码时，同样提交CSRF令牌作为表单数据 ---
         # 我们需要从登录成功后返回的 /manage 页面中，获取一个新的CSRF令牌，
         # 因为Flask-WTF可能为每个表单生成不同的令牌。
-        soup = BeautifulSoup(login_res.text, 'lxml')
-        form_csrf_token = soup.find('input', {'name': 'csrf_token'}).get('value')
+        form_csrf_token = extract_csrf_token(login_res.text)
         if not form_csrf_token:
             raise Exception("无法在管理页面上找到生成表单的CSRF令牌")
 
@@ -203,7 +300,7 @@ def prerequisite_tasks(base_url, num_codes_to_generate):
         return False
 
 
-def cleanup_tasks(base_url):
+def cleanup_tasks(executor, base_url):
     activated_machines = SHARED_STATE['activated_machines']
     if not activated_machines:
         print("\n[INFO] 无需清理，测试期间未激活任何设备。")
@@ -215,13 +312,18 @@ def cleanup_tasks(base_url):
         csrf_token = SHARED_STATE.get('csrf_token')
         if not csrf_token: raise Exception("无法获取CSRF令牌用于清理")
 
-        headers = {'X-CSRFToken': csrf_token}
-        revoked_count = 0
-        for machine_id in activated_machines:
-            revoke_res = session.post(f"{base_url}/api/revoke_authorization", json={'machine_id': machine_id},
+        headers = {'X-CSRFToken': csrf_token, **JSON_HEADERS}
+        url = f"{base_url}/api/revoke_authorization"
+        # 设备ID均为测试自己生成的十六进制串，无需转义，直接套入预先编码好的请求体模板
+        body_template = b'{"machine_id":"%s"}'
+
+        def revoke(machine_id):
+            revoke_res = session.post(url, data=body_template % machine_id.encode('ascii'),
                                       headers=headers, timeout=10)
-            if revoke_res.status_code == 200:
-                revoked_count += 1
+            return revoke_res.status_code
+
+        # 撤销请求互不依赖，交给共享线程池并行发送
+        revoked_count = sum(1 for status in executor.map(revoke, activated_machines) if status == 200)
         print(f"[SUCCESS] 清理完成！成功撤销 {revoked_count}/{len(activated_machines)} 个授权。")
     except Exception as e:
         print(f"[ERROR] 清理任务失败: {e}")
@@ -231,7 +333,7 @@ def generate_report():
     print("\n\n" + "=" * 60 + "\n" + " " * 22 + "最终性能报告" + "\n" + "=" * 60)
     for scenario_name, results in test_results.items():
         total_time = results['end_time'] - results['start_time']
-        status_codes, response_times, errors = results['status_codes'], results['response_times'], results['errors']
+        status_codes, thread_buffers, errors = results['status_codes'], results['thread_buffers'], results['errors']
         total_requests = sum(status_codes.values())
         successful_requests = status_codes.get(200, 0)
         rps = total_requests / total_time if total_time > 0 else 0
@@ -241,11 +343,13 @@ def generate_report():
         print(
             f"  请求总数: {total_requests} (成功: {successful_requests}, 失败: {total_requests - successful_requests})")
 
-        if response_times:
-            avg = np.mean(response_times) * 1000
-            p90 = np.percentile(response_times, 90) * 1000
-            p99 = np.percentile(response_times, 99) * 1000
-            max_rt = np.max(response_times) * 1000
+        if total_requests:
+            # 合并各线程的直方图；平均值与最大值精确统计，分位数由直方图估算
+            hist = np.sum([buffer['hist'] for buffer in thread_buffers], axis=0)
+            avg = sum(buffer['sum'] for buffer in thread_buffers) / total_requests * 1000
+            max_rt = max(buffer['max'] for buffer in thread_buffers) * 1000
+            # 桶中点可能略高于实际最大值，以精确的最大值为上限
+            p90, p99 = np.minimum(histogram_quantiles(hist, [0.90, 0.99]) * 1000, max_rt)
             print(f"  响应时间 (ms): 平均={avg:.2f}, P90={p90:.2f}, P99={p99:.2f}, 最大={max_rt:.2f}")
 
         if errors:
@@ -266,16 +370,19 @@ if __name__ == "__main__":
     args = parser.parse_args()
 
     scenarios_to_run = args.scenarios or SCENARIO_EXECUTION_ORDER
+    mount_connection_pool(SHARED_STATE['session'], args.concurrency)
 
     if 'activate' in scenarios_to_run:
         if not prerequisite_tasks(args.base_url, args.num_requests):
             exit(1)
 
-    for scenario_name in SCENARIO_EXECUTION_ORDER:
-        if scenario_name in scenarios_to_run:
-            run_scenario(args.base_url, scenario_name, args.num_requests, args.concurrency)
+    # 工作线程只创建一次，在所有场景之间复用
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for scenario_name in SCENARIO_EXECUTION_ORDER:
+            if scenario_name in scenarios_to_run:
+                run_scenario(executor, args.base_url, scenario_name, args.num_requests, args.concurrency)
 
-    if not args.no_cleanup:
-        cleanup_tasks(args.base_url)
+        if not args.no_cleanup:
+            cleanup_tasks(executor, args.base_url)
 
     generate_report()
\ No newline at end of file
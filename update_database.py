@@ -1,5 +1,20 @@
+import os
 import re
-import json
+
+import ijson
+import orjson
+
+DATABASE_PATH = "dictionary_database.json"
+TEMP_DATABASE_PATH = DATABASE_PATH + ".tmp"
+
+# --- 预编译正则表达式 ---
+_INDEX_SECTION_RE = re.compile(r'仅仅包括.*?形声字组')
+_HEADER_SPLIT_RE = re.compile(r'(\n\s*《.*?》)')
+_LEVEL_RE = re.compile(r"(一级|二级|三级)字表")
+_TYPE_RE = re.compile(r"的(指事字|象形字|会意字)")
+_CHAR_RE = re.compile(r"《(.)》")
+_PINYIN_RE = re.compile(r"读音\s*([a-zāáǎàēéěèīíǐìōóǒòūúǔùǖǘǚǜü]+)")
+_DEF_RE = re.compile(r"本义[为是]?\s*([^。，\n]+)")
 
 
 def parse_additional_material(text_content):
@@ -8,8 +23,8 @@ def parse_additional_material(text_content):
     current_char_type = "未知类型"
 
     # 移除不包含详细释义的索引部分
-    content_to_parse = re.split(r'仅仅包括.*?形声字组', text_content)[0]
-    blocks = re.split(r'(\n\s*《.*?》)', content_to_parse)
+    content_to_parse = _INDEX_SECTION_RE.split(text_content, 1)[0]
+    blocks = _HEADER_SPLIT_RE.split(content_to_parse)
 
     context_text = blocks[0]
 
@@ -17,21 +32,21 @@ def parse_additional_material(text_content):
         header = blocks[i].strip()
         body = blocks[i + 1].strip()
 
-        level_match = re.search(r"(一级|二级|三级)字表", context_text)
+        level_match = _LEVEL_RE.search(context_text)
         if level_match: current_level = level_match.group(1)
 
-        type_match = re.search(r"的(指事字|象形字|会意字)", context_text)
+        type_match = _TYPE_RE.search(context_text)
         if type_match: current_char_type = type_match.group(1)
 
-        char_match = re.search(r"《(.)》", header)
+        char_match = _CHAR_RE.search(header)
         if char_match:
             char = char_match.group(1)
             explanation_text = f"{header[1:]} {body}"
 
-            pinyin_match = re.search(r"读音\s*([a-zāáǎàēéěèīíǐìōóǒòūúǔùǖǘǚǜü]+)", explanation_text)
+            pinyin_match = _PINYIN_RE.search(explanation_text)
             pinyin = pinyin_match.group(1) if pinyin_match else ""
 
-            definition_match = re.search(r"本义[为是]?\s*([^。，\n]+)", explanation_text)
+            definition_match = _DEF_RE.search(explanation_text)
             definition = definition_match.group(1).strip() if definition_match else ""
 
             parsed_data[char] = {
@@ -58,16 +73,39 @@ def create_new_entry(char, new_info):
     }
 
 
+def apply_new_info(entry, new_info):
+    """用附加材料更新已有条目；由附加材料新建的条目保持原样。返回条目是否被更新"""
+    metadata = entry.get('metadata')
+    if metadata is not None and 'source' in metadata:
+        return False
+
+    analysis = entry.get('analysis')
+    if analysis is None: entry['analysis'] = analysis = {}
+    analysis['explanation'] = new_info['new_explanation']
+
+    char_types = entry.get('char_type')
+    if char_types is None: entry['char_type'] = char_types = []
+    authoritative_type = new_info['authoritative_type']
+    if authoritative_type not in char_types:
+        char_types.insert(0, authoritative_type)
+
+    new_pinyin, new_definition = new_info['new_pinyin'], new_info['new_definition']
+    if new_pinyin: entry['pinyin'] = new_pinyin
+    if new_definition: entry['definition'] = new_definition
+
+    if metadata is None: entry['metadata'] = metadata = {}
+    metadata['level'] = new_info['level']
+    return True
+
+
+def encode_item(char, entry, first):
+    """按 orjson OPT_INDENT_2 输出整个字典时的格式，编码顶层的一个键值对"""
+    value = orjson.dumps(entry, option=orjson.OPT_INDENT_2).replace(b'\n', b'\n  ')
+    return (b'\n  ' if first else b',\n  ') + orjson.dumps(char) + b': ' + value
+
+
 # --- 主程序 ---
 if __name__ == "__main__":
-    try:
-        with open("dictionary_database.json", "r", encoding="utf-8") as f:
-            database_data = json.load(f)
-        print(f"成功加载基础数据库 'dictionary_database.json'，包含 {len(database_data)} 个条目。")
-    except (FileNotFoundError, json.JSONDecodeError):
-        print("错误：未找到 'dictionary_database.json'。请先运行 'generate_json_database.py'。")
-        exit()
-
     try:
         with open("additional_material.txt", "r", encoding="utf-16") as f:
             additional_text = f.read()
@@ -79,33 +117,44 @@ if __name__ == "__main__":
     new_char_info = parse_additional_material(additional_text)
     print(f"解析完成，提取了 {len(new_char_info)} 个字的权威信息。")
 
+    # 基础数据库以 ijson 逐条流式读取，边合并边写入临时文件，完成后再替换原文件，
+    # 内存中始终只有当前一个条目，而不是整个数据库
     update_count = 0
     add_count = 0
-    for char, new_info in new_char_info.items():
-        # setdefault 确保即使是新字也能被正确处理
-        entry = database_data.setdefault(char, create_new_entry(char, new_info))
-
-        if 'source' in entry.get('metadata', {}):  # 这是一个新创建的条目
-            add_count += 1
-        else:  # 这是一个需要更新的条目
-            entry.setdefault('analysis', {})['explanation'] = new_info['new_explanation']
-            char_types = entry.setdefault('char_type', [])
-            if new_info['authoritative_type'] not in char_types:
-                char_types.insert(0, new_info['authoritative_type'])
-
-            if new_info['new_pinyin']: entry['pinyin'] = new_info['new_pinyin']
-            if new_info['new_definition']: entry['definition'] = new_info['new_definition']
-
-            entry.setdefault('metadata', {})['level'] = new_info['level']
-            update_count += 1
+    entry_count = 0
+    pending = dict(new_char_info)  # 尚未在数据库中出现的字，最后作为新条目追加
+    try:
+        with open(DATABASE_PATH, "rb") as src, open(TEMP_DATABASE_PATH, "wb") as dst:
+            dst.write(b'{')
+            # use_float 让小数解析为 float 而不是 Decimal，以便 orjson 序列化
+            for char, entry in ijson.kvitems(src, '', use_float=True):
+                new_info = pending.pop(char, None)
+                if new_info is not None:
+                    if apply_new_info(entry, new_info):
+                        update_count += 1
+                    else:
+                        add_count += 1
+                dst.write(encode_item(char, entry, entry_count == 0))
+                entry_count += 1
+            print(f"成功读取基础数据库 '{DATABASE_PATH}'，包含 {entry_count} 个条目。")
+
+            for char, new_info in pending.items():
+                dst.write(encode_item(char, create_new_entry(char, new_info), entry_count == 0))
+                entry_count += 1
+                add_count += 1
+            dst.write(b'\n}' if entry_count else b'}')
+    except (FileNotFoundError, ijson.JSONError):
+        print(f"错误：未找到或无法解析 '{DATABASE_PATH}'。请先运行 'generate_json_database.py'。")
+        if os.path.exists(TEMP_DATABASE_PATH): os.remove(TEMP_DATABASE_PATH)
+        exit()
+    except Exception as e:
+        print(f"\n写入文件时发生错误: {e}")
+        if os.path.exists(TEMP_DATABASE_PATH): os.remove(TEMP_DATABASE_PATH)
+        exit()
 
     print(f"\n合并完成！")
     print(f"- {update_count} 个现有条目已被更新/扩充。")
     print(f"- {add_count} 个新条目已添加到数据库。")
 
-    try:
-        with open("dictionary_database.json", "w", encoding="utf-8") as f:
-            json.dump(database_data, f, ensure_ascii=False, indent=4)
-        print("\n成功将最终数据保存回 'dictionary_database.json'！")
-    except Exception as e:
-        print(f"\n写入文件时发生错误: {e}")
\ No newline at end of file
+    os.replace(TEMP_DATABASE_PATH, DATABASE_PATH)
+    print(f"\n成功将最终数据保存回 '{DATABASE_PATH}'！")